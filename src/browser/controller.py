@@ -4,50 +4,271 @@ Manages Playwright browser instances and page interactions
 """
 
 import asyncio
+import uuid
 from contextlib import asynccontextmanager
-from typing import Optional, Dict, Any, List
+from time import monotonic
+from typing import Optional, Dict, Any, List, Set, Callable, Awaitable
+from urllib.parse import urlsplit
 from playwright.async_api import async_playwright, Browser, BrowserContext, Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from loguru import logger
 
 
+# Maximum number of URLs kept in the PageMem cache
+PAGEMEM_MAX_ENTRIES = 64
+
+# Maximum number of characters of visible page text sent to the LLM
+TEXT_CONTENT_LIMIT = 5000
+
+# Collects everything get_page_content needs in a single CDP round-trip.
+# The DOM is only read, never mutated, so no style/layout invalidation occurs.
+# When the fingerprint matches the one passed in, the walk is skipped. The
+# fingerprint is a per-document id plus a MutationObserver change counter, so
+# any DOM change (including attribute toggles like hidden/class/style) or a
+# new document at the same URL invalidates it.
+PAGE_SNAPSHOT_JS = """
+({known, textLimit}) => {
+    if (!window.__agentObserver) {
+        window.__agentDocumentId = Math.random().toString(36).slice(2);
+        window.__agentMutations = 0;
+        window.__agentObserver = new MutationObserver(records => {
+            window.__agentMutations += records.length;
+        });
+        window.__agentObserver.observe(document, {
+            subtree: true, childList: true, attributes: true, characterData: true
+        });
+    }
+    // Count mutations still queued for the observer callback
+    window.__agentMutations += window.__agentObserver.takeRecords().length;
+    
+    const fingerprint = window.__agentDocumentId + '|' + window.__agentMutations + '|' +
+        location.href + '|' + document.title;
+    if (fingerprint === known) {
+        return {fingerprint: fingerprint, unchanged: true};
+    }
+    
+    // Collect visible text only up to the limit, rather than building
+    // innerText for the whole page and discarding most of it
+    let text = '';
+    const skipped = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEMPLATE']);
+    const textWalker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+    let node;
+    while (text.length < textLimit && (node = textWalker.nextNode())) {
+        const parent = node.parentElement;
+        if (!parent || skipped.has(parent.tagName)) continue;
+        const value = node.nodeValue.trim();
+        // getClientRects also counts position: fixed content (banners, dialogs)
+        if (value && parent.getClientRects().length > 0) {
+            text += value + ' ';
+        }
+    }
+    text = text.slice(0, textLimit);
+    
+    // One native pass with a combined selector; only matching elements reach the loop
+    const interactive = [];
+    const forms = [];
+    const formIndex = new Map();
+    
+    // One bounded bucket per selector, concatenated in this priority order, so
+    // e.g. buttons still come before links however many links precede them
+    const selectors = [
+        'button', 'input', 'select', 'textarea',
+        'a[href]', '[onclick]', '[role="button"]'
+    ];
+    const buckets = {};
+    const counts = {};
+    selectors.forEach(selector => { buckets[selector] = []; counts[selector] = 0; });
+    
+    // Every selector an element matches, so nth-of-type numbering counts it under each
+    const matchSelectors = (el, tag) => {
+        const matched = [];
+        switch (tag) {
+            case 'BUTTON': matched.push('button'); break;
+            case 'INPUT': matched.push('input'); break;
+            case 'SELECT': matched.push('select'); break;
+            case 'TEXTAREA': matched.push('textarea'); break;
+            case 'A': if (el.hasAttribute('href')) matched.push('a[href]'); break;
+        }
+        if (el.hasAttribute('onclick')) matched.push('[onclick]');
+        if (el.getAttribute('role') === 'button') matched.push('[role="button"]');
+        return matched;
+    };
+    
+    const matches = document.body.querySelectorAll(
+        'form,button,input,select,textarea,a[href],[onclick],[role="button"]'
+    );
+    for (const el of matches) {
+        const tag = el.tagName;
+        
+        if (tag === 'FORM') {
+            formIndex.set(el, forms.length);
+            forms.push({
+                action: el.action || '',
+                method: el.method || 'get',
+                fields: [],
+                selector: 'form:nth-of-type(' + (forms.length + 1) + ')'
+            });
+            continue;
+        }
+        
+        if ((tag === 'INPUT' || tag === 'SELECT' || tag === 'TEXTAREA') && formIndex.has(el.form)) {
+            forms[formIndex.get(el.form)].fields.push({
+                name: el.name || '',
+                type: el.type || '',
+                placeholder: el.placeholder || '',
+                required: el.required
+            });
+        }
+        
+        for (const selector of matchSelectors(el, tag)) {
+            const index = ++counts[selector];
+            const bucket = buckets[selector];
+            // A full bucket can never reach the final 50, so skip the element reads
+            if (bucket.length >= 50) continue;
+            
+            // Read-only pass: offsetParent never follows a DOM write, so layout is computed once
+            if (el.offsetParent !== null) { // Only visible elements
+                bucket.push({
+                    tag: tag.toLowerCase(),
+                    type: el.type || '',
+                    text: el.innerText?.slice(0, 100) || '',
+                    placeholder: el.placeholder || '',
+                    href: el.href || '',
+                    selector: selector + ':nth-of-type(' + index + ')'
+                });
+            }
+        }
+    }
+    
+    for (const selector of selectors) {
+        interactive.push(...buckets[selector]);
+        if (interactive.length >= 50) break;
+    }
+    
+    return {
+        fingerprint: fingerprint,
+        title: document.title,
+        text: text,
+        interactive: interactive.slice(0, 50), // Limit to first 50 elements
+        forms: forms
+    };
+}
+"""
+
+# True once no new resource has finished loading for 500ms. Resource entries
+# cover XHR/fetch too, so this also settles after in-page (SPA) updates. A
+# PerformanceObserver sees every completion, unlike the resource timing buffer,
+# which stops growing once full (250 entries by default).
+NETWORK_SETTLE_JS = """
+(token) => {
+    const now = performance.now();
+    const state = window.__agentSettle;
+    
+    // A new token means a new wait: start observing and restart the quiet period
+    if (!state || state.token !== token) {
+        if (state) state.observer.disconnect();
+        const fresh = {token: token, lastChange: now};
+        fresh.observer = new PerformanceObserver(list => {
+            if (list.getEntries().length) fresh.lastChange = performance.now();
+        });
+        fresh.observer.observe({type: 'resource'});
+        window.__agentSettle = fresh;
+        return false;
+    }
+    
+    if (now - state.lastChange < 500) return false;
+    state.observer.disconnect();
+    return true;
+}
+"""
+
+
+ActionHandler = Callable[[Page, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
 class BrowserController:
     """Main browser controller using Playwright"""
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.playwright = None
-        self.browser = None
-        
-    async def initialize(self):
-        """Initialize Playwright and browser"""
-        if not self.playwright:
-            self.playwright = await async_playwright().start()
-            
-        browser_type = getattr(self.playwright, self.config.get('browser', 'chromium'))
-        self.browser = await browser_type.launch(
-            headless=self.config.get('headless', True),
-            args=self.config.get('args', [
-                '--disable-blink-features=AutomationControlled',
-                '--disable-web-security',
-                '--disable-features=VizDisplayCompositor'
-            ])
+        # Headless and headed browsers are launched lazily on first use and kept warm
+        self._browsers: Dict[bool, Browser] = {}
+        self._launch_lock = asyncio.Lock()
+        # Idle contexts per browser mode, each capped at context_pool_size. Reset relies
+        # on CDP to clear per-origin storage, so other engines do not pool contexts.
+        self._context_pools: Dict[bool, asyncio.Queue] = {True: asyncio.Queue(), False: asyncio.Queue()}
+        self._context_pool_size = (
+            self.config.get('context_pool_size', 1)
+            if self.config.get('browser', 'chromium') == 'chromium' else 0
         )
+        # Origins each pooled context has visited, so their storage can be cleared on release
+        self._context_origins: Dict[BrowserContext, Set[str]] = {}
+        # Pooled contexts returned since their last reset; they are reset on next acquire
+        self._dirty_contexts: Set[BrowserContext] = set()
+        # PageMem: last extracted content per URL, reused while the DOM is unchanged
+        self._pagemem_cache: Dict[str, Dict[str, Any]] = {}
+        # Action type -> bound handler, built once instead of an if/elif chain per call
+        self._actions: Dict[str, ActionHandler] = {
+            'click': self._do_click,
+            'type': self._do_type,
+            'navigate': self._do_navigate,
+            'wait': self._do_wait,
+            'scroll': self._do_scroll,
+            'select': self._do_select,
+        }
         
-        logger.info(f"Browser initialized: {self.config.get('browser', 'chromium')}")
+    def _resolve_headless(self, headless: Optional[bool]) -> bool:
+        """Use the configured mode when the caller does not ask for one"""
+        return self.config.get('headless', True) if headless is None else headless
+        
+    async def initialize(self, headless: Optional[bool] = None):
+        """Launch the browser for a mode if needed, pre-warming its context pool"""
+        headless = self._resolve_headless(headless)
+        if headless in self._browsers:
+            return
+            
+        async with self._launch_lock:
+            if headless in self._browsers:
+                return
+                
+            if not self.playwright:
+                self.playwright = await async_playwright().start()
+                
+            browser_type = getattr(self.playwright, self.config.get('browser', 'chromium'))
+            self._browsers[headless] = await browser_type.launch(
+                headless=headless,
+                args=self.config.get('args', [
+                    '--disable-blink-features=AutomationControlled',
+                    '--disable-web-security',
+                    '--disable-features=VizDisplayCompositor'
+                ])
+            )
+            
+            contexts = await asyncio.gather(
+                *(self._new_pooled_context(headless) for _ in range(self._context_pool_size))
+            )
+            for context in contexts:
+                self._context_pools[headless].put_nowait(context)
+                
+        mode = 'headless' if headless else 'headed'
+        logger.info(f"Browser initialized: {self.config.get('browser', 'chromium')} ({mode})")
         
     async def cleanup(self):
         """Clean up browser resources"""
-        if self.browser:
-            await self.browser.close()
+        for pool in self._context_pools.values():
+            while not pool.empty():
+                await self._close_context(pool.get_nowait())
+        for browser in self._browsers.values():
+            await browser.close()
+        self._browsers.clear()
         if self.playwright:
             await self.playwright.stop()
+            self.playwright = None
             
-    @asynccontextmanager
-    async def create_context(self, headless: Optional[bool] = None):
-        """Create a browser context with automatic cleanup"""
-        await self.initialize()
-        
-        context = await self.browser.new_context(
+    async def _new_context(self, headless: bool) -> BrowserContext:
+        """Create a new browser context with the configured defaults"""
+        return await self._browsers[headless].new_context(
             viewport={'width': 1920, 'height': 1080},
             user_agent=self.config.get('user_agent', 
                 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
@@ -55,160 +276,251 @@ class BrowserController:
             ),
             ignore_https_errors=True
         )
+            
+    async def _new_pooled_context(self, headless: bool) -> BrowserContext:
+        """Create a context that records the origins its frames navigate to"""
+        context = await self._new_context(headless)
+        origins = self._context_origins[context] = set()
+        
+        def track_origins(page: Page):
+            page.on('framenavigated', lambda frame: self._record_origin(origins, frame.url))
+            
+        context.on('page', track_origins)
+        return context
+        
+    @staticmethod
+    def _record_origin(origins: Set[str], url: str):
+        """Add the origin of an http(s) URL to the set"""
+        parts = urlsplit(url)
+        if parts.scheme in ('http', 'https'):
+            origins.add(f"{parts.scheme}://{parts.netloc}")
+            
+    async def _clear_context_state(self, context: BrowserContext):
+        """Clear cookies, permissions and all per-origin storage left by the last borrower"""
+        origins = self._context_origins.get(context, set())
+        
+        if origins:
+            page = context.pages[0] if context.pages else await context.new_page()
+            session = await context.new_cdp_session(page)
+            try:
+                # 'all' covers localStorage, IndexedDB, Cache Storage and service workers
+                for origin in origins:
+                    await session.send('Storage.clearDataForOrigin', {
+                        'origin': origin, 'storageTypes': 'all'
+                    })
+            finally:
+                await session.detach()
+            origins.clear()
+            
+        # Closing the pages also drops their sessionStorage
+        await asyncio.gather(*(page.close() for page in context.pages))
+        await context.clear_permissions()
+        await context.clear_cookies()
+        
+    async def _close_context(self, context: BrowserContext):
+        """Close a context and forget its tracked state"""
+        self._context_origins.pop(context, None)
+        self._dirty_contexts.discard(context)
+        await context.close()
+            
+    @asynccontextmanager
+    async def create_context(self, headless: Optional[bool] = None):
+        """Create a browser context with automatic cleanup"""
+        headless = self._resolve_headless(headless)
+        await self.initialize(headless)
+        
+        context = await self._new_context(headless)
         
         try:
             yield context
         finally:
             await context.close()
             
-    async def take_screenshot(self, page: Page, path: str = None) -> bytes:
-        """Take a screenshot of the current page"""
+    async def acquire_context(self, headless: Optional[bool] = None) -> BrowserContext:
+        """Take an idle context from the pool, resetting it if it was used, or create one"""
+        headless = self._resolve_headless(headless)
+        await self.initialize(headless)
+        pool = self._context_pools[headless]
+        
+        while not pool.empty():
+            context = pool.get_nowait()
+            if context not in self._dirty_contexts:
+                return context
+                
+            self._dirty_contexts.discard(context)
+            try:
+                await self._clear_context_state(context)
+                return context
+            except Exception as e:
+                logger.warning(f"Discarding context that failed to reset: {e}")
+                await self._close_context(context)
+                
+        return await self._new_pooled_context(headless)
+            
+    async def release_context(self, context: BrowserContext):
+        """Return a context to the pool, or close it if the pool is full"""
+        pool = next(
+            (self._context_pools[mode] for mode, browser in self._browsers.items()
+             if browser is context.browser),
+            None
+        )
+        
+        # The slot is taken without awaiting, so concurrent releases cannot overfill
+        # the pool. The reset waits for the next acquire, which one-shot runs that
+        # go straight to cleanup() never pay for.
+        if pool is not None and pool.qsize() < self._context_pool_size:
+            self._dirty_contexts.add(context)
+            pool.put_nowait(context)
+            return
+            
+        await self._close_context(context)
+        
+    @asynccontextmanager
+    async def pooled_context(self, headless: Optional[bool] = None):
+        """Borrow a context from the pool for the duration of the block"""
+        context = await self.acquire_context(headless)
+        
+        try:
+            yield context
+        finally:
+            await self.release_context(context)
+            
+    async def take_screenshot(self, page: Page, path: str = None, quality: int = 70,
+                              full_page: bool = False,
+                              clip: Optional[Dict[str, float]] = None) -> bytes:
+        """Take a JPEG screenshot of the viewport, or of clip (e.g. an element's bounding_box())"""
+        # Keep PNG when the caller explicitly asks for a .png file
+        if path and path.lower().endswith('.png'):
+            return await page.screenshot(path=path, full_page=full_page, clip=clip, type='png')
+            
         screenshot = await page.screenshot(
             path=path,
-            full_page=True,
-            type='png'
+            full_page=full_page,
+            clip=clip,
+            type='jpeg',
+            quality=quality
         )
         return screenshot
         
     async def get_page_content(self, page: Page) -> Dict[str, Any]:
         """Extract comprehensive page content for LLM analysis"""
         try:
-            # Get basic page info
-            title = await page.title()
+            # Get basic page info; the title comes back with the snapshot
             url = page.url
             
-            # Get visible text content
-            text_content = await page.evaluate("""
-                () => {
-                    // Remove script and style elements
-                    const scripts = document.querySelectorAll('script, style');
-                    scripts.forEach(el => el.remove());
-                    
-                    // Get visible text
-                    return document.body.innerText || document.body.textContent || '';
-                }
-            """)
-            
-            # Get interactive elements
-            interactive_elements = await page.evaluate("""
-                () => {
-                    const elements = [];
-                    const selectors = [
-                        'button', 'input', 'select', 'textarea', 
-                        'a[href]', '[onclick]', '[role="button"]'
-                    ];
-                    
-                    selectors.forEach(selector => {
-                        document.querySelectorAll(selector).forEach((el, index) => {
-                            if (el.offsetParent !== null) { // Only visible elements
-                                elements.push({
-                                    tag: el.tagName.toLowerCase(),
-                                    type: el.type || '',
-                                    text: el.innerText?.slice(0, 100) || '',
-                                    placeholder: el.placeholder || '',
-                                    href: el.href || '',
-                                    selector: selector + ':nth-of-type(' + (index + 1) + ')'
-                                });
-                            }
-                        });
-                    });
-                    
-                    return elements.slice(0, 50); // Limit to first 50 elements
-                }
-            """)
-            
-            # Get form information
-            forms = await page.evaluate("""
-                () => {
-                    const forms = [];
-                    document.querySelectorAll('form').forEach((form, index) => {
-                        const fields = [];
-                        form.querySelectorAll('input, select, textarea').forEach(field => {
-                            fields.push({
-                                name: field.name || '',
-                                type: field.type || '',
-                                placeholder: field.placeholder || '',
-                                required: field.required
-                            });
-                        });
-                        
-                        forms.push({
-                            action: form.action || '',
-                            method: form.method || 'get',
-                            fields: fields,
-                            selector: 'form:nth-of-type(' + (index + 1) + ')'
-                        });
-                    });
-                    
-                    return forms;
-                }
-            """)
+            # Get text, interactive elements and forms in one evaluation,
+            # unless the page still matches the cached fingerprint
+            cached = self._pagemem_cache.get(url)
+            snapshot = await page.evaluate(PAGE_SNAPSHOT_JS, {
+                'known': cached['fingerprint'] if cached else None,
+                'textLimit': TEXT_CONTENT_LIMIT
+            })
             
-            return {
-                'title': title,
+            if snapshot.get('unchanged'):
+                logger.debug(f"Page unchanged, reusing cached content: {url}")
+                return dict(cached, timestamp=monotonic())
+            
+            content = {
+                'title': snapshot['title'],
                 'url': url,
-                'text_content': text_content[:5000],  # Limit content length
-                'interactive_elements': interactive_elements,
-                'forms': forms,
-                'timestamp': asyncio.get_event_loop().time()
+                'text_content': snapshot['text'],  # Already limited in the page
+                'interactive_elements': snapshot['interactive'],
+                'forms': snapshot['forms'],
+                'fingerprint': snapshot['fingerprint']
             }
             
+            if url not in self._pagemem_cache and len(self._pagemem_cache) >= PAGEMEM_MAX_ENTRIES:
+                self._pagemem_cache.pop(next(iter(self._pagemem_cache)))
+            self._pagemem_cache[url] = content
+            
+            return dict(content, timestamp=monotonic())
+            
         except Exception as e:
             logger.error(f"Error extracting page content: {e}")
+            # Avoid another CDP call on a page that just failed; use the last snapshot
+            cached = self._pagemem_cache.get(page.url)
             return {
-                'title': await page.title(),
+                'title': cached['title'] if cached else '',
                 'url': page.url,
                 'error': str(e),
-                'timestamp': asyncio.get_event_loop().time()
+                'timestamp': monotonic()
             }
             
+    async def wait_for_settle(self, page: Page, action_type: Optional[str] = None):
+        """Wait for the page to settle after an action instead of sleeping a fixed time"""
+        try:
+            await page.wait_for_load_state('domcontentloaded', timeout=5000)
+            
+            # Clicks and navigations usually trigger requests; wait for them to quiet down
+            if action_type in ('click', 'navigate'):
+                await page.wait_for_function(
+                    NETWORK_SETTLE_JS, arg=uuid.uuid4().hex, polling=100, timeout=3000
+                )
+                
+        except PlaywrightTimeoutError:
+            logger.debug(f"Page did not settle after {action_type}, continuing")
+            
+    def register_action(self, action_type: str, handler: ActionHandler):
+        """Register a handler for an additional action type"""
+        self._actions[action_type] = handler
+        
     async def execute_action(self, page: Page, action: Dict[str, Any]) -> Dict[str, Any]:
         """Execute a browser action based on LLM instruction"""
         try:
             action_type = action.get('type')
+            handler = self._actions.get(action_type)
             
-            if action_type == 'click':
-                selector = action.get('selector')
-                await page.click(selector, timeout=10000)
-                return {'success': True, 'message': f'Clicked {selector}'}
-                
-            elif action_type == 'type':
-                selector = action.get('selector')
-                text = action.get('text')
-                await page.fill(selector, text, timeout=10000)
-                return {'success': True, 'message': f'Typed in {selector}'}
-                
-            elif action_type == 'navigate':
-                url = action.get('url')
-                await page.goto(url, timeout=30000)
-                return {'success': True, 'message': f'Navigated to {url}'}
-                
-            elif action_type == 'wait':
-                selector = action.get('selector')
-                timeout = action.get('timeout', 10000)
-                await page.wait_for_selector(selector, timeout=timeout)
-                return {'success': True, 'message': f'Waited for {selector}'}
-                
-            elif action_type == 'scroll':
-                direction = action.get('direction', 'down')
-                amount = action.get('amount', 500)
-                
-                if direction == 'down':
-                    await page.evaluate(f'window.scrollBy(0, {amount})')
-                elif direction == 'up':
-                    await page.evaluate(f'window.scrollBy(0, -{amount})')
-                    
-                return {'success': True, 'message': f'Scrolled {direction}'}
-                
-            elif action_type == 'select':
-                selector = action.get('selector')
-                value = action.get('value')
-                await page.select_option(selector, value, timeout=10000)
-                return {'success': True, 'message': f'Selected {value} in {selector}'}
-                
-            else:
+            if handler is None:
                 return {'success': False, 'message': f'Unknown action type: {action_type}'}
                 
+            return await handler(page, action)
+            
+        except KeyError as e:
+            logger.error(f"Action {action} is missing field {e}")
+            return {'success': False, 'message': f'Action failed: missing field {e}'}
         except Exception as e:
             logger.error(f"Error executing action {action}: {e}")
             return {'success': False, 'message': f'Action failed: {str(e)}'}
+            
+    async def _do_click(self, page: Page, action: Dict[str, Any]) -> Dict[str, Any]:
+        """Click the element matching the selector"""
+        selector = action['selector']
+        await page.click(selector, timeout=10000)
+        return {'success': True, 'message': f'Clicked {selector}'}
+        
+    async def _do_type(self, page: Page, action: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill the element matching the selector with text"""
+        selector = action['selector']
+        await page.fill(selector, action['text'], timeout=10000)
+        return {'success': True, 'message': f'Typed in {selector}'}
+        
+    async def _do_navigate(self, page: Page, action: Dict[str, Any]) -> Dict[str, Any]:
+        """Navigate to a URL"""
+        url = action['url']
+        await page.goto(url, timeout=30000)
+        return {'success': True, 'message': f'Navigated to {url}'}
+        
+    async def _do_wait(self, page: Page, action: Dict[str, Any]) -> Dict[str, Any]:
+        """Wait for an element matching the selector"""
+        selector = action['selector']
+        await page.wait_for_selector(selector, timeout=action.get('timeout', 10000))
+        return {'success': True, 'message': f'Waited for {selector}'}
+        
+    async def _do_scroll(self, page: Page, action: Dict[str, Any]) -> Dict[str, Any]:
+        """Scroll the window up or down"""
+        direction = action.get('direction', 'down')
+        amount = action.get('amount', 500)
+        
+        if direction == 'down':
+            await page.evaluate(f'window.scrollBy(0, {amount})')
+        elif direction == 'up':
+            await page.evaluate(f'window.scrollBy(0, -{amount})')
+            
+        return {'success': True, 'message': f'Scrolled {direction}'}
+        
+    async def _do_select(self, page: Page, action: Dict[str, Any]) -> Dict[str, Any]:
+        """Select an option in a select element"""
+        selector = action['selector']
+        value = action['value']
+        await page.select_option(selector, value, timeout=10000)
+        return {'success': True, 'message': f'Selected {value} in {selector}'}
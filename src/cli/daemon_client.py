@@ -0,0 +1,96 @@
+"""
+Daemon Client
+Forwards parsed CLI commands to a running browser daemon over a Unix socket
+"""
+
+import asyncio
+import json
+import os
+import stat
+import tempfile
+from typing import Optional, Dict, Any
+
+from loguru import logger
+
+
+SOCKET_NAME = 'ai-browser-agent.sock'
+
+
+def get_socket_dir() -> str:
+    """Per-user directory holding the daemon socket"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'ai-browser-agent')
+    return os.path.join(tempfile.gettempdir(), f'ai-browser-agent-{os.getuid()}')
+
+
+def get_socket_path() -> str:
+    """Path of the daemon socket for the current user"""
+    return os.path.join(get_socket_dir(), SOCKET_NAME)
+
+
+def is_private_path(path: str, file_type: int) -> bool:
+    """Whether path is a file_type entry owned by this user and closed to everyone else"""
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return False
+    return (stat.S_IFMT(st.st_mode) == file_type and st.st_uid == os.getuid()
+            and not st.st_mode & 0o077)
+
+
+def ensure_socket_dir() -> str:
+    """Create the private socket directory, refusing one another user controls"""
+    socket_dir = get_socket_dir()
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    
+    if not is_private_path(socket_dir, stat.S_IFDIR):
+        raise RuntimeError(f"Socket directory is not private to this user: {socket_dir}")
+        
+    return socket_dir
+
+
+def is_daemon_command(args) -> bool:
+    """Whether a command can run in the daemon (it must not need the local terminal or display)"""
+    if not args.headless:
+        return False
+    if args.command == 'login':
+        # Never send passwords over the socket
+        return not args.password
+    return args.command in ('navigate', 'task')
+
+
+async def send_command(args, socket_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Send parsed arguments to the daemon and return its reply, or None if no daemon is running"""
+    if not hasattr(asyncio, 'open_unix_connection'):
+        return None
+        
+    socket_path = socket_path or get_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+        
+    # Only talk to a socket this user created in a directory no one else can write to
+    if not (is_private_path(os.path.dirname(socket_path), stat.S_IFDIR)
+            and is_private_path(socket_path, stat.S_IFSOCK)):
+        logger.warning(f"Ignoring daemon socket not owned privately by this user: {socket_path}")
+        return None
+        
+    try:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+        
+    payload = dict(vars(args))
+    if payload.get('urls'):
+        # The daemon may run from another working directory
+        payload['urls'] = os.path.abspath(payload['urls'])
+        
+    try:
+        writer.write(json.dumps(payload).encode() + b'\n')
+        await writer.drain()
+        reply = await reader.read()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+        
+    return json.loads(reply)
@@ -17,6 +17,7 @@ def create_cli_parser() -> argparse.ArgumentParser:
 Examples:
   %(prog)s navigate --url "https://example.com" --headless
   %(prog)s task --prompt "Click the login button" --url "https://site.com"
+  %(prog)s task --prompt "Extract the price" --urls urls.txt --concurrency 8
   %(prog)s login --site "github.com" --username "user" --password "pass"
   %(prog)s interactive --site "https://admin.dashboard.com"
         """
@@ -43,6 +44,12 @@ Examples:
         help='Default timeout in milliseconds (default: 30000)'
     )
     
+    parser.add_argument(
+        '--no-daemon',
+        action='store_true',
+        help='Always run in-process, even if a browser daemon is running'
+    )
+    
     parser.add_argument(
         '--verbose', '-v',
         action='store_true',
@@ -85,6 +92,17 @@ Examples:
         '--url',
         help='URL to start the task from'
     )
+    task_parser.add_argument(
+        '--urls',
+        metavar='FILE',
+        help='File with one start URL per line; runs the task on each concurrently'
+    )
+    task_parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=4,
+        help='Maximum number of URLs processed at once with --urls (default: 4)'
+    )
     task_parser.add_argument(
         '--max-steps',
         type=int,
@@ -136,3 +154,12 @@ def post_process_args(args):
         args.headless = False
     
     return args
+
+
+# Built once at import; argparse parsers can be reused for any number of parse_args() calls
+_PARSER = create_cli_parser()
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the shared CLI argument parser"""
+    return _PARSER
@@ -5,51 +5,85 @@ Handles integration with Google's Gemini Flash 2.5 API for intelligent browser a
 
 import json
 import asyncio
-from typing import Dict, Any, List, Optional
+from collections import deque
+from time import monotonic
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple
 from playwright.async_api import Page
-import google.generativeai as genai
+import aiohttp
 from loguru import logger
 from .prompt_templates import PromptTemplates
 from .response_parser import ResponseParser
 
+if TYPE_CHECKING:
+    from browser.controller import BrowserController
+
+
+# Maximum number of (page fingerprint, task) action plans and prompts kept in memory
+PLAN_CACHE_MAX_ENTRIES = 256
+PROMPT_CACHE_MAX_ENTRIES = 256
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+
 
 class GeminiClient:
     """Client for Gemini Flash 2.5 LLM integration"""
     
-    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash"):
+    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash", history_max: int = 500):
         self.api_key = api_key
         self.model_name = model_name
-        self.conversation_history = []
+        # Only the most recent entries are kept; counters track totals
+        self.conversation_history = deque(maxlen=history_max)
+        self._tasks_executed = 0
+        self._pages_analyzed = 0
+        self._plan_cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._prompt_cache: Dict[Tuple[str, str], str] = {}
+        # Gemini requests currently in flight, shared by concurrent callers with the same prompt
+        self._inflight: Dict[str, asyncio.Future] = {}
+        
+        # Pooled HTTP session for the Gemini REST API, created on first request
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._endpoint = GEMINI_API_URL.format(model=model_name)
         
-        # Configure Gemini
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(model_name)
         self.prompt_templates = PromptTemplates()
         self.response_parser = ResponseParser()
         
         logger.info(f"Gemini client initialized with model: {model_name}")
         
-    async def analyze_page_and_plan(self, page_content: Dict[str, Any], task: str) -> Dict[str, Any]:
+    async def analyze_page_and_plan(self, page_content: Dict[str, Any], task: str,
+                                    use_cache: bool = True) -> Dict[str, Any]:
         """Analyze page content and create action plan for the task"""
         try:
+            # Reuse the plan if this exact page state was already analyzed for the task
+            fingerprint = page_content.get('fingerprint')
+            cache_key = (fingerprint, task)
+            if use_cache and fingerprint and cache_key in self._plan_cache:
+                logger.debug(f"Reusing cached action plan for: {page_content.get('url')}")
+                return self._plan_cache[cache_key]
+            
             # Prepare the analysis prompt
-            prompt = self.prompt_templates.get_task_analysis_prompt(page_content, task)
+            prompt = self._get_task_analysis_prompt(page_content, task)
             
             # Generate response
-            response = await self._generate_content(prompt)
+            response_text = await self._generate_content(prompt)
             
             # Parse the response
-            action_plan = self.response_parser.parse_action_plan(response.text)
+            action_plan = self.response_parser.parse_action_plan(response_text)
             
             # Store in conversation history
+            self._pages_analyzed += 1
             self.conversation_history.append({
                 'type': 'page_analysis',
                 'task': task,
                 'page_url': page_content.get('url'),
                 'action_plan': action_plan,
-                'timestamp': asyncio.get_event_loop().time()
+                'timestamp': monotonic()
             })
             
+            if fingerprint and action_plan.get('success', True):
+                if len(self._plan_cache) >= PLAN_CACHE_MAX_ENTRIES:
+                    self._plan_cache.pop(next(iter(self._plan_cache)))
+                self._plan_cache[cache_key] = action_plan
+            
             return action_plan
             
         except Exception as e:
@@ -60,13 +94,33 @@ class GeminiClient:
                 'actions': []
             }
     
-    async def execute_task(self, page: Page, task: str, max_steps: int = 10) -> str:
+    def _get_task_analysis_prompt(self, page_content: Dict[str, Any], task: str) -> str:
+        """Build the task analysis prompt, memoized by (page fingerprint, task)"""
+        fingerprint = page_content.get('fingerprint')
+        if not fingerprint:
+            return self.prompt_templates.get_task_analysis_prompt(page_content, task)
+            
+        cache_key = (fingerprint, task)
+        prompt = self._prompt_cache.get(cache_key)
+        if prompt is None:
+            prompt = self.prompt_templates.get_task_analysis_prompt(page_content, task)
+            if len(self._prompt_cache) >= PROMPT_CACHE_MAX_ENTRIES:
+                self._prompt_cache.pop(next(iter(self._prompt_cache)))
+            self._prompt_cache[cache_key] = prompt
+            
+        return prompt
+    
+    async def execute_task(self, page: Page, task: str, controller: 'BrowserController',
+                           max_steps: int = 10) -> str:
         """Execute a complete task with iterative LLM guidance"""
         logger.info(f"Starting task execution: {task}")
         
         step_count = 0
         task_completed = False
         execution_log = []
+        # Page states this run has already acted on; a cached plan for them would
+        # just repeat the same action, so the LLM is asked again instead
+        acted_on = set()
         
         while step_count < max_steps and not task_completed:
             step_count += 1
@@ -74,12 +128,13 @@ class GeminiClient:
             
             try:
                 # Get current page state
-                from ..browser.controller import BrowserController
-                controller = BrowserController({})
                 page_content = await controller.get_page_content(page)
                 
                 # Get LLM analysis and next action
-                analysis = await self.analyze_page_and_plan(page_content, task)
+                fingerprint = page_content.get('fingerprint')
+                analysis = await self.analyze_page_and_plan(
+                    page_content, task, use_cache=fingerprint not in acted_on
+                )
                 
                 if not analysis.get('success', True):
                     return f"Task failed at step {step_count}: {analysis.get('error')}"
@@ -93,6 +148,7 @@ class GeminiClient:
                 # Execute the first action
                 action = actions[0]
                 result = await controller.execute_action(page, action)
+                acted_on.add(fingerprint)
                 
                 execution_log.append({
                     'step': step_count,
@@ -104,8 +160,8 @@ class GeminiClient:
                 if action.get('completes_task', False) or result.get('task_complete', False):
                     task_completed = True
                     
-                # Wait a bit between actions
-                await asyncio.sleep(1)
+                # Wait for the page to settle before the next step
+                await controller.wait_for_settle(page, action.get('type'))
                 
             except Exception as e:
                 logger.error(f"Error in step {step_count}: {e}")
@@ -122,13 +178,14 @@ class GeminiClient:
             summary = f"⚠️ Task reached maximum steps ({max_steps}) without completion"
             
         # Store execution in history
+        self._tasks_executed += 1
         self.conversation_history.append({
             'type': 'task_execution',
             'task': task,
             'steps': step_count,
             'completed': task_completed,
             'execution_log': execution_log,
-            'timestamp': asyncio.get_event_loop().time()
+            'timestamp': monotonic()
         })
         
         return summary
@@ -141,8 +198,8 @@ class GeminiClient:
                 page_content, error, original_task
             )
             
-            response = await self._generate_content(prompt)
-            recovery_plan = self.response_parser.parse_action_plan(response.text)
+            response_text = await self._generate_content(prompt)
+            recovery_plan = self.response_parser.parse_action_plan(response_text)
             
             return recovery_plan
             
@@ -154,17 +211,65 @@ class GeminiClient:
                 'actions': []
             }
     
-    async def _generate_content(self, prompt: str) -> Any:
-        """Generate content using Gemini API"""
-        try:
-            # Use async generation if available, otherwise use sync
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None, 
-                lambda: self.model.generate_content(prompt)
+    async def _generate_content(self, prompt: str) -> str:
+        """Generate content, coalescing identical prompts that are already in flight"""
+        pending = self._inflight.get(prompt)
+        
+        if pending is None:
+            pending = asyncio.ensure_future(self._request_content(prompt))
+            self._inflight[prompt] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(prompt, None))
+        else:
+            logger.debug("Joining in-flight Gemini request for identical prompt")
+            
+        # Shield so one cancelled caller does not cancel the request for the others
+        return await asyncio.shield(pending)
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it inside the running loop"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32),
+                timeout=aiohttp.ClientTimeout(total=60),
+                headers={'x-goog-api-key': self.api_key}
             )
+        return self._session
+    
+    async def _request_content(self, prompt: str) -> str:
+        """Generate content using the Gemini REST API"""
+        try:
+            payload = {'contents': [{'parts': [{'text': prompt}]}]}
             
-            return response
+            async with self._get_session().post(self._endpoint, json=payload) as response:
+                if response.status >= 400:
+                    # Keep Gemini's error message (e.g. INVALID_ARGUMENT details, quota errors)
+                    body = await response.text()
+                    try:
+                        message = json.loads(body)['error']['message']
+                    except (ValueError, KeyError, TypeError):
+                        message = body or response.reason
+                    raise aiohttp.ClientResponseError(
+                        response.request_info,
+                        response.history,
+                        status=response.status,
+                        message=f"{response.reason}: {message}",
+                        headers=response.headers
+                    )
+                data = await response.json()
+                
+            candidates = data.get('candidates') or []
+            if not candidates:
+                raise ValueError(f"Gemini returned no candidates: {data.get('promptFeedback')}")
+                
+            # Blocked or empty candidates (e.g. finishReason SAFETY) carry no text
+            parts = candidates[0].get('content', {}).get('parts', [])
+            texts = [part['text'] for part in parts if 'text' in part]
+            if not texts:
+                raise ValueError(
+                    f"Gemini returned no text (finishReason: {candidates[0].get('finishReason')})"
+                )
+                
+            return ''.join(texts)
             
         except Exception as e:
             logger.error(f"Error generating content from Gemini: {e}")
@@ -172,16 +277,25 @@ class GeminiClient:
     
     def get_conversation_summary(self) -> Dict[str, Any]:
         """Get summary of conversation history"""
+        recent = min(5, len(self.conversation_history))
         return {
-            'total_interactions': len(self.conversation_history),
-            'tasks_executed': len([h for h in self.conversation_history 
-                                 if h['type'] == 'task_execution']),
-            'pages_analyzed': len([h for h in self.conversation_history 
-                                 if h['type'] == 'page_analysis']),
-            'history': self.conversation_history[-5:]  # Last 5 interactions
+            'total_interactions': self._tasks_executed + self._pages_analyzed,
+            'tasks_executed': self._tasks_executed,
+            'pages_analyzed': self._pages_analyzed,
+            # Last 5 interactions; indexing near the ends of a deque is O(1)
+            'history': [self.conversation_history[i] for i in range(-recent, 0)]
         }
     
+    async def close(self):
+        """Close the HTTP session used for Gemini requests"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+    
     def clear_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.conversation_history.clear()
+        self._tasks_executed = 0
+        self._pages_analyzed = 0
+        self._plan_cache.clear()
+        self._prompt_cache.clear()
         logger.info("Conversation history cleared")
@@ -10,19 +10,34 @@ from pathlib import Path
 # Add src to Python path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from cli.parser import create_cli_parser
+from cli.parser import get_parser, post_process_args
+from cli.daemon_client import is_daemon_command, send_command
 from browser.controller import BrowserController
 from llm.gemini_client import GeminiClient
 from security.credential_manager import CredentialManager
 from config.settings import Settings
 
+try:
+    import uvloop
+except ImportError:  # Optional: falls back to the default asyncio loop
+    uvloop = None
+
 
 async def main():
     """Main application entry point"""
+    llm_client = None
+    browser_controller = None
     try:
         # Parse command line arguments
-        parser = create_cli_parser()
-        args = parser.parse_args()
+        parser = get_parser()
+        args = post_process_args(parser.parse_args())
+        
+        # Hand the command to a warm browser daemon when one is running
+        if not args.no_daemon and is_daemon_command(args):
+            reply = await send_command(args)
+            if reply is not None:
+                print(reply['output'], end='')
+                return reply['status']
         
         # Load configuration
         settings = Settings()
@@ -49,13 +64,18 @@ async def main():
     except Exception as e:
         print(f"❌ Error: {e}")
         return 1
+    finally:
+        if browser_controller:
+            await browser_controller.cleanup()
+        if llm_client:
+            await llm_client.close()
     
     return 0
 
 
 async def execute_navigate_command(args, browser_controller):
     """Execute navigation command"""
-    async with browser_controller.create_context(headless=args.headless) as context:
+    async with browser_controller.pooled_context(headless=args.headless) as context:
         page = await context.new_page()
         await page.goto(args.url)
         
@@ -70,7 +90,11 @@ async def execute_navigate_command(args, browser_controller):
 
 async def execute_task_command(args, browser_controller, llm_client):
     """Execute LLM-guided task"""
-    async with browser_controller.create_context(headless=args.headless) as context:
+    if args.urls:
+        await execute_batch_task_command(args, browser_controller, llm_client)
+        return
+    
+    async with browser_controller.pooled_context(headless=args.headless) as context:
         page = await context.new_page()
         
         # Start with current page or navigate to URL
@@ -78,13 +102,40 @@ async def execute_task_command(args, browser_controller, llm_client):
             await page.goto(args.url)
         
         # Let LLM analyze and execute the task
-        result = await llm_client.execute_task(page, args.prompt)
+        result = await llm_client.execute_task(
+            page, args.prompt, browser_controller, max_steps=args.max_steps
+        )
         print(f"✅ Task completed: {result}")
 
 
+async def execute_batch_task_command(args, browser_controller, llm_client):
+    """Execute the same LLM-guided task on many URLs concurrently in one browser"""
+    with open(args.urls) as f:
+        urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    
+    async def run_one(url):
+        async with semaphore:
+            async with browser_controller.pooled_context(headless=args.headless) as context:
+                page = await context.new_page()
+                await page.goto(url)
+                return await llm_client.execute_task(
+                    page, args.prompt, browser_controller, max_steps=args.max_steps
+                )
+    
+    results = await asyncio.gather(*(run_one(url) for url in urls), return_exceptions=True)
+    
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            print(f"❌ {url}: {result}")
+        else:
+            print(f"✅ {url}: {result}")
+
+
 async def execute_login_command(args, browser_controller, credential_manager):
     """Execute login command"""
-    async with browser_controller.create_context(headless=args.headless) as context:
+    async with browser_controller.pooled_context(headless=args.headless) as context:
         page = await context.new_page()
         
         # Get or store credentials
@@ -107,7 +158,7 @@ async def execute_interactive_mode(args, browser_controller, llm_client):
     print("🤖 Starting interactive mode...")
     print("Type 'exit' to quit, 'help' for commands")
     
-    async with browser_controller.create_context(headless=False) as context:
+    async with browser_controller.pooled_context(headless=False) as context:
         page = await context.new_page()
         
         if args.site:
@@ -127,7 +178,7 @@ async def execute_interactive_mode(args, browser_controller, llm_client):
                     print(f"✅ Navigated to: {url}")
                 elif command.startswith('task '):
                     task = command[5:].strip()
-                    result = await llm_client.execute_task(page, task)
+                    result = await llm_client.execute_task(page, task, browser_controller)
                     print(f"✅ {result}")
                 else:
                     print("❌ Unknown command. Type 'help' for available commands.")
@@ -139,4 +190,5 @@ async def execute_interactive_mode(args, browser_controller, llm_client):
 
 
 if __name__ == "__main__":
-    sys.exit(asyncio.run(main()))
+    run = uvloop.run if uvloop else asyncio.run
+    sys.exit(run(main()))
@@ -0,0 +1,172 @@
+"""
+AI Browser Agent - Daemon
+Keeps a warm browser and serves CLI commands over a Unix socket
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+from argparse import Namespace
+from contextlib import redirect_stdout, suppress
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from loguru import logger
+from cli.daemon_client import ensure_socket_dir, get_socket_path
+from browser.controller import BrowserController
+from llm.gemini_client import GeminiClient
+from security.credential_manager import CredentialManager
+from config.settings import Settings
+from main import execute_navigate_command, execute_task_command, execute_login_command
+
+try:
+    import uvloop
+except ImportError:  # Optional: falls back to the default asyncio loop
+    uvloop = None
+
+
+class AgentDaemon:
+    """Serves CLI commands against one long-lived browser"""
+    
+    def __init__(self, socket_path: Optional[str] = None):
+        self.socket_path = socket_path or get_socket_path()
+        
+        settings = Settings()
+        self.credential_manager = CredentialManager()
+        self.llm_client = GeminiClient(settings.gemini_api_key)
+        self.browser_controller = BrowserController(settings.browser_config)
+        
+        # Commands print their results, so stdout is captured one command at a time
+        self._lock = asyncio.Lock()
+        
+    async def run_command(self, args: Namespace) -> str:
+        """Run a command and return what it printed"""
+        output = io.StringIO()
+        
+        async with self._lock:
+            with redirect_stdout(output):
+                if args.command == 'navigate':
+                    await execute_navigate_command(args, self.browser_controller)
+                elif args.command == 'task':
+                    await execute_task_command(args, self.browser_controller, self.llm_client)
+                elif args.command == 'login':
+                    await execute_login_command(args, self.browser_controller, self.credential_manager)
+                else:
+                    print(f"❌ Command not supported by daemon: {args.command}")
+                    
+        return output.getvalue()
+        
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Handle one JSON-encoded command per connection"""
+        try:
+            try:
+                line = await reader.readline()
+                if not line.strip():
+                    return  # Connection probe, e.g. the "already running" check
+                    
+                payload = json.loads(line)
+                if not isinstance(payload, dict) or 'command' not in payload:
+                    raise ValueError("expected an object with a command")
+            except ValueError as e:
+                logger.warning(f"Ignoring malformed daemon request: {e}")
+                reply = {'output': f"❌ Malformed request: {e}\n", 'status': 1}
+            else:
+                args = Namespace(**payload)
+                logger.info(f"Daemon running command: {args.command}")
+                
+                reply = await self._run_until_disconnect(args, reader)
+                if reply is None:
+                    return
+                    
+            writer.write(json.dumps(reply).encode())
+            await writer.drain()
+        except ConnectionError:
+            logger.debug("Client disconnected before the reply was sent")
+        finally:
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+                
+    async def _run_until_disconnect(self, args: Namespace,
+                                    reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+        """Run a command, cancelling it if the client disconnects (e.g. Ctrl-C) first"""
+        command = asyncio.ensure_future(self.run_command(args))
+        # The client sends nothing after its request, so this only completes at EOF
+        disconnected = asyncio.ensure_future(reader.read())
+        
+        try:
+            await asyncio.wait({command, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnected.cancel()
+            if disconnected.done() and not disconnected.cancelled():
+                disconnected.exception()  # A reset connection also counts as a disconnect
+            
+        if not command.done():
+            logger.warning(f"Client disconnected, cancelling command: {args.command}")
+            command.cancel()
+            with suppress(asyncio.CancelledError):
+                await command
+            return None
+            
+        try:
+            return {'output': command.result(), 'status': 0}
+        except Exception as e:
+            logger.error(f"Error running daemon command: {e}")
+            return {'output': f"❌ Error: {e}\n", 'status': 1}
+            
+    async def serve(self):
+        """Launch the browser and serve commands until interrupted"""
+        ensure_socket_dir()
+        
+        if os.path.exists(self.socket_path):
+            try:
+                _, writer = await asyncio.open_unix_connection(self.socket_path)
+            except ConnectionRefusedError:
+                os.unlink(self.socket_path)  # Stale socket from a previous run
+            else:
+                writer.close()
+                await writer.wait_closed()
+                raise RuntimeError(f"Daemon already running on {self.socket_path}")
+                
+        await self.browser_controller.initialize()
+        
+        # Bind with a private umask so the socket is never reachable by other users
+        previous_umask = os.umask(0o077)
+        try:
+            server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        finally:
+            os.umask(previous_umask)
+        logger.info(f"Daemon listening on {self.socket_path}")
+        
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.browser_controller.cleanup()
+            await self.llm_client.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+async def main():
+    """Daemon entry point"""
+    try:
+        await AgentDaemon().serve()
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return 1
+    
+    return 0
+
+
+if __name__ == "__main__":
+    run = uvloop.run if uvloop else asyncio.run
+    try:
+        sys.exit(run(main()))
+    except KeyboardInterrupt:
+        print("\n👋 Daemon stopped")